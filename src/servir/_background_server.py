@@ -1,10 +1,10 @@
 from __future__ import annotations
 
+import importlib.util
+import socket
 import sys
 import threading
-import time
 
-import portpicker
 import uvicorn
 from starlette.types import ASGIApp
 
@@ -13,6 +13,41 @@ if sys.version_info >= (3, 11):
 else:
     from typing_extensions import Self
 
+# Prefer the C-accelerated event loop and HTTP parser when they are installed
+# (`pip install servir[fast]`). uvloop is unavailable on Windows.
+_LOOP = "uvloop" if importlib.util.find_spec("uvloop") is not None else "asyncio"
+_HTTP = "httptools" if importlib.util.find_spec("httptools") is not None else "h11"
+
+
+def _bind_socket(host: str, port: int) -> socket.socket:
+    """Bind a TCP socket, letting the OS pick a free port if `port` is 0."""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    # an explicit protocol lets asyncio enable TCP_NODELAY on accepted connections
+    sock = socket.socket(family, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+    except OSError:
+        sock.close()
+        raise
+    sock.set_inheritable(True)
+    return sock
+
+
+class _Server(uvicorn.Server):
+    """A uvicorn server that signals a threading.Event once it is ready."""
+
+    def __init__(self, config: uvicorn.Config) -> None:
+        super().__init__(config=config)
+        self.ready = threading.Event()
+
+    async def startup(self, sockets: list[socket.socket] | None = None) -> None:
+        try:
+            await super().startup(sockets=sockets)
+        finally:
+            # set even if startup fails so that waiters are released
+            self.ready.set()
+
 
 class BackgroundServer:
     """A threading-based background server for Starlette apps."""
@@ -21,7 +56,7 @@ class BackgroundServer:
     _host: str | None
     _port: int | None
     _server_thread: threading.Thread | None
-    _server: uvicorn.Server | None
+    _server: _Server | None
 
     def __init__(self, app: ASGIApp) -> None:
         """Initialize a background server for the given Starlette app.
@@ -107,22 +142,30 @@ class BackgroundServer:
         if self._server_thread is not None:
             return self
 
+        # bind up front so the port is known (and reserved) before the server starts
+        sock = _bind_socket(host, port or 0)
         config = uvicorn.Config(
             app=self.app,
             host=host,
-            port=port or portpicker.pick_unused_port(),
+            port=sock.getsockname()[1],
             timeout_keep_alive=timeout,
             log_level=log_level,
+            loop=_LOOP,
+            http=_HTTP,
         )
 
         self._host = config.host
         self._port = config.port
-        self._server = uvicorn.Server(config=config)
-        self._server_thread = threading.Thread(target=self._server.run, daemon=daemon)
+        self._server = _Server(config=config)
+        self._server_thread = threading.Thread(
+            target=self._server.run, kwargs={"sockets": [sock]}, daemon=daemon
+        )
         self._server_thread.start()
 
         # wait for the server to start
-        while not self._server.started:
-            time.sleep(1e-3)
+        self._server.ready.wait(timeout=5.0)
+        if not self._server.started:
+            self.stop()
+            raise RuntimeError("Server failed to start.")
 
         return self
@@ -1,10 +1,14 @@
 from __future__ import annotations
 
+import contextlib
+import io
 import os
 import pathlib
+import sys
 import typing
 import weakref
 
+from anyio import to_thread
 from starlette.applications import Starlette
 from starlette.middleware.cors import CORSMiddleware
 
@@ -16,6 +20,31 @@ from servir._resources import (
     create_resource_route,
 )
 from servir._tilesets import TilesetResource, TilesetType, create_tileset_route
+from servir._util import BLOCK_SIZE
+
+if sys.version_info >= (3, 11):
+    from typing import Self
+else:
+    from typing_extensions import Self
+
+K = typing.TypeVar("K")
+V = typing.TypeVar("V")
+
+
+def _register(
+    registry: typing.MutableMapping[K, V], key: K, value: V, maxsize: int | None
+) -> V:
+    """Add a value to an insertion-ordered registry, reusing an existing entry.
+
+    Returns the registered value. Once the registry holds more than `maxsize`
+    entries, the least recently registered ones are evicted.
+    """
+    value = registry.pop(key, value)
+    registry[key] = value
+    if maxsize is not None:
+        while len(registry) > maxsize:
+            del registry[next(iter(registry))]
+    return value
 
 
 class Provider(BackgroundServer):
@@ -23,23 +52,62 @@ class Provider(BackgroundServer):
 
     _resources: typing.MutableMapping[str, Resource]
     _tilesets: typing.MutableMapping[str, TilesetResource[TilesetProtocol]]
-
-    def __init__(self, proxy: bool = False):
+    _url: str | None
+
+    def __init__(
+        self,
+        proxy: bool = False,
+        max_resources: int | None = 10_000,
+        max_threads: int | None = None,
+        weak: bool = False,
+        block_size: int = BLOCK_SIZE,
+    ):
         """Create a new Provider.
 
         Parameters
         ----------
         proxy : bool, optional
             Whether the url should be proxied for `jupyter-server-proxy` (default: False).
+        max_resources : int, optional
+            The maximum number of resources (and, separately, tilesets) to keep
+            registered. The least recently created are released first. If None,
+            resources are kept until explicitly released (default: 10_000).
+        max_threads : int, optional
+            The size of the worker thread pool used for blocking request handlers
+            such as file reads (default: 16 per CPU, at least 64).
+        weak : bool, optional
+            Whether to hold resources weakly, releasing each one once it is no
+            longer referenced elsewhere (default: False). This adds a weakref
+            indirection to every lookup, so prefer `release` where possible.
+        block_size : int, optional
+            The default size of the blocks that file and stream resources are
+            sent in (default: 1 MiB). Larger blocks mean fewer reads and sends
+            per response, at the cost of more memory per in-flight response.
         """
-        self._resources = weakref.WeakValueDictionary()
-        self._tilesets = weakref.WeakValueDictionary()
+        if weak:
+            self._resources = weakref.WeakValueDictionary()
+            self._tilesets = weakref.WeakValueDictionary()
+        else:
+            self._resources = {}
+            self._tilesets = {}
+        self._max_resources = max_resources
+        self._block_size = block_size
+
+        if max_threads is None:
+            max_threads = max(64, (os.cpu_count() or 1) * 16)
+
+        @contextlib.asynccontextmanager
+        async def lifespan(_: Starlette) -> typing.AsyncIterator[None]:
+            # the limiter is per event loop, so this only affects our server thread
+            to_thread.current_default_thread_limiter().total_tokens = max_threads
+            yield
 
         app = Starlette(
             routes=[
                 create_tileset_route(self._tilesets),
                 create_resource_route(self._resources),
             ],
+            lifespan=lifespan,
         )
         # TODO: make this configurable?
         app.add_middleware(
@@ -50,9 +118,26 @@ class Provider(BackgroundServer):
             allow_headers=["*"],
         )
 
-        self.proxy = proxy
+        self._proxy = proxy
+        self._url = None
         super().__init__(app)
 
+    @property
+    def proxy(self) -> bool:
+        """Whether the url should be proxied for `jupyter-server-proxy`."""
+        return self._proxy
+
+    @proxy.setter
+    def proxy(self, proxy: bool) -> None:
+        self._proxy = proxy
+        self._url = None
+
+    def stop(self) -> Self:
+        """Stop the background server thread."""
+        # the port (and therefore the url) changes once the server restarts
+        self._url = None
+        return super().stop()
+
     @property
     def url(self) -> str:
         """The URL for this provider.
@@ -62,23 +147,33 @@ class Provider(BackgroundServer):
         If the environment variable `JUPYTERHUB_SERVICE_PREFIX` is set, the URL will be
         prefixed for JupyterHub.
 
+        The URL is computed once the server is running and cached until it is
+        stopped.
+
         Returns
         -------
         str
             The URL for this provider.
         """
-        if self.proxy:
-            return f"/proxy/{self.port}"
+        if self._url is not None:
+            return self._url
 
+        if self.proxy:
+            url = f"/proxy/{self.port}"
         # https://github.com/yuvipanda/altair_data_server/blob/4d6ffcb19f864218c8d825ff2c95a1c8180585d0/altair_data_server/_altair_server.py#L73-L93
-        if "JUPYTERHUB_SERVICE_PREFIX" in os.environ:
+        elif "JUPYTERHUB_SERVICE_PREFIX" in os.environ:
             urlprefix = os.environ["JUPYTERHUB_SERVICE_PREFIX"]
-            return f"{urlprefix}/proxy/{self.port}"
+            url = f"{urlprefix}/proxy/{self.port}"
+        else:
+            url = f"http://{self.host}:{self.port}"
 
-        return f"http://{self.host}:{self.port}"
+        self._url = url
+        return url
 
     @typing.overload
-    def create(self, path: pathlib.Path | str, /, **kwargs: typing.Any) -> Resource: ...
+    def create(
+        self, path: pathlib.Path | str | typing.BinaryIO, /, **kwargs: typing.Any
+    ) -> Resource: ...
 
     @typing.overload
     def create(
@@ -86,14 +181,17 @@ class Provider(BackgroundServer):
     ) -> TilesetResource[TilesetType]: ...
 
     def create(
-        self, x: pathlib.Path | str | TilesetType, /, **kwargs: typing.Any
+        self,
+        x: pathlib.Path | str | typing.BinaryIO | TilesetType,
+        /,
+        **kwargs: typing.Any,
     ) -> Resource | TilesetResource[TilesetType]:
-        """Create a resource from a path or tileset.
+        """Create a resource from a path, string, binary stream or tileset.
 
         Parameters
         ----------
-        x : pathlib.Path | str | TilesetProtocol
-            The path or tileset to create a resource from.
+        x : pathlib.Path | str | typing.BinaryIO | TilesetProtocol
+            The path, string, binary stream or tileset to create a resource from.
         **kwargs
             Additional keyword arguments to pass to the resource constructor.
 
@@ -104,17 +202,37 @@ class Provider(BackgroundServer):
         """
         resource: Resource | TilesetResource[TilesetProtocol]
 
-        if not isinstance(x, (pathlib.Path, str)):
-            resource = TilesetResource(x, provider=self, **kwargs)
-            if resource.uid in self._tilesets:
-                resource = self._tilesets[resource.uid]
-            else:
-                self._tilesets[resource.uid] = resource
+        if not isinstance(x, (pathlib.Path, str, io.IOBase)):
+            tileset_resource: TilesetResource[TilesetProtocol] = TilesetResource(
+                typing.cast(TilesetProtocol, x), provider=self, **kwargs
+            )
+            resource = _register(
+                self._tilesets,
+                tileset_resource.uid,
+                tileset_resource,
+                self._max_resources,
+            )
         else:
-            resource = create_resource(x, provider=self, **kwargs)
-            if resource.guid in self._resources:
-                resource = self._resources[resource.guid]
-            self._resources[resource.guid] = resource
+            kwargs.setdefault("block_size", self._block_size)
+            file_resource = create_resource(x, provider=self, **kwargs)
+            resource = _register(
+                self._resources, file_resource.guid, file_resource, self._max_resources
+            )
 
         self.start()
         return typing.cast(TilesetResource[TilesetType], resource)
+
+    def release(self, resource: Resource | TilesetResource[TilesetType]) -> None:
+        """Stop serving a resource.
+
+        Parameters
+        ----------
+        resource : Resource | TilesetResource
+            The resource to release. Releasing a resource that is not registered
+            is a no-op.
+        """
+        if isinstance(resource, TilesetResource):
+            if self._tilesets.get(resource.uid) is resource:
+                del self._tilesets[resource.uid]
+        elif self._resources.get(resource.guid) is resource:
+            del self._resources[resource.guid]
@@ -1,19 +1,33 @@
 from __future__ import annotations
 
 import abc
+import io
+import os
 import pathlib
+import stat
+import threading
 import typing
 import uuid
 
+from starlette.concurrency import run_in_threadpool
 from starlette.requests import Request
-from starlette.responses import Response
-from starlette.routing import Mount, Route
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Mount
+from starlette.types import Receive, Scope, Send
+from starlette.websockets import WebSocketClose
 
 from servir._protocols import ProviderProtocol
 from servir._util import (
+    BLOCK_SIZE,
+    PrebuiltResponse,
+    content_hash,
     create_file_response,
-    create_resource_identifier,
+    create_path_identifier,
+    etag_matches,
+    file_stat_headers,
     guess_media_type,
+    read_spooled_blocks,
+    spool_stream,
 )
 
 __all__ = [
@@ -21,11 +35,18 @@ __all__ = [
     "FileResource",
     "DirectoryResource",
     "ContentResource",
+    "SpooledContentResource",
     "create_resource_route",
+    "resource_endpoint",
     "create_resource",
 ]
 
 
+def _content_validators(digest: str) -> dict[str, str]:
+    # clients revalidate with the content hash, matching file resources
+    return {"Cache-Control": "no-cache", "ETag": f'"{digest}"'}
+
+
 class Resource(metaclass=abc.ABCMeta):
     """A resource that can be served by a provider."""
 
@@ -33,6 +54,7 @@ class Resource(metaclass=abc.ABCMeta):
         self,
         provider: ProviderProtocol,
         headers: None | dict[str, str] = None,
+        block_size: int = BLOCK_SIZE,
     ):
         """Create a new Resource.
 
@@ -42,10 +64,16 @@ class Resource(metaclass=abc.ABCMeta):
             The provider that will serve this resource.
         headers : dict[str, str], optional
             Additional headers to include in the response.
+        block_size : int, optional
+            The size of the blocks streamed response bodies are sent in
+            (default: 1 MiB).
         """
         self.headers = headers or {}
+        self.block_size = block_size
         self._provider = provider
         self._guid = uuid.uuid4().hex
+        self._url_base: str | None = None
+        self._url = ""
 
     @property
     def guid(self) -> str:
@@ -55,7 +83,12 @@ class Resource(metaclass=abc.ABCMeta):
     @property
     def url(self) -> str:
         """The URL for this resource."""
-        return f"{self._provider.url}/resources/{self.guid}"
+        base = self._provider.url
+        # the provider caches its url, so it is only rebuilt after a restart
+        if base is not self._url_base:
+            self._url_base = base
+            self._url = f"{base}/resources/{self.guid}"
+        return self._url
 
     @abc.abstractmethod
     def get(self, request: Request) -> Response:
@@ -79,14 +112,33 @@ class FileResource(Resource):
         super().__init__(**kwargs)
         assert path.is_file(), "Path must be a file"
         self._path = path
-        self._guid = create_resource_identifier(
-            data=path.resolve().as_posix(), id=path.name
-        )
+        self._guid = create_path_identifier(path)
+        self._media_type = guess_media_type(path)
+
+    @property
+    def size(self) -> int:
+        """The current size of the file in bytes."""
+        return self._path.stat().st_size
 
     def get(self, request: Request) -> Response:
-        response = create_file_response(self._path, request.headers.get("range"))
-        response.headers.update(self.headers)
-        return response
+        try:
+            # the file may change while it is served, so it is stat'd per request
+            stat_result = self._path.stat()
+        except OSError:
+            return Response(status_code=404)
+        stat_headers = file_stat_headers(stat_result)
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, stat_headers["ETag"]):
+            return Response(status_code=304, headers=stat_headers)
+        return create_file_response(
+            self._path,
+            request.headers.get("range"),
+            media_type=self._media_type,
+            stat_result=stat_result,
+            headers={**stat_headers, **self.headers},
+            head=request.method == "HEAD",
+            block_size=self.block_size,
+        )
 
 
 class DirectoryResource(Resource):
@@ -114,17 +166,38 @@ class DirectoryResource(Resource):
             raise ValueError("Path must be a directory")
 
         self._path = path
-        self._guid = create_resource_identifier(
-            data=path.resolve().as_posix(),
-            id=path.name.lstrip("/"),
-        )
+        self._root = str(path.resolve())
+        self._guid = create_path_identifier(path)
 
     def get(self, request: Request) -> Response:
         full_path: str = request.path_params["path"]
-        resolved = self._path / full_path.replace(self._guid, "").lstrip("/")
-        response = create_file_response(resolved, request.headers.get("range"))
-        response.headers.update(self.headers)
-        return response
+        # requests are routed here by their first segment, which is the guid
+        sub_path = full_path[len(self._guid) :].lstrip("/")
+        # resolved on every request, since any component may since have been
+        # replaced, e.g. by a symlink pointing outside of the directory
+        resolved = pathlib.Path(self._root, sub_path).resolve()
+        # don't serve anything outside of the directory, e.g. via '..' or symlinks
+        if os.path.commonpath([self._root, resolved]) != self._root:
+            return Response(status_code=404)
+        try:
+            # stat once, and pass the result on rather than re-stating the file
+            stat_result = resolved.stat()
+        except OSError:
+            return Response(status_code=404)
+        if not stat.S_ISREG(stat_result.st_mode):
+            return Response(status_code=404)
+        stat_headers = file_stat_headers(stat_result)
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, stat_headers["ETag"]):
+            return Response(status_code=304, headers=stat_headers)
+        return create_file_response(
+            resolved,
+            request.headers.get("range"),
+            stat_result=stat_result,
+            headers={**stat_headers, **self.headers},
+            head=request.method == "HEAD",
+            block_size=self.block_size,
+        )
 
 
 class ContentResource(Resource):
@@ -148,19 +221,123 @@ class ContentResource(Resource):
         self._content = content
         if extension is None:
             extension = ".txt" if isinstance(content, str) else ".bin"
-        self._guid = create_resource_identifier(data=content, id=f"content{extension}")
-
-    def get(self, _: Request) -> Response:
-        return Response(
-            content=self._content,
+        digest = content_hash(content)
+        self._guid = f"{digest[:7]}-content{extension}"
+        self._validators = _content_validators(digest)
+        # the content is immutable, so the responses are encoded once and replayed
+        self._response = PrebuiltResponse(
+            content=content,
             media_type=guess_media_type(self._guid),
-            headers=self.headers.copy(),
+            headers={**self._validators, **self.headers},
         )
+        self._not_modified = PrebuiltResponse(status_code=304, headers=self._validators)
+
+    def get(self, request: Request) -> Response:
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, self._validators["ETag"]):
+            return self._not_modified
+        return self._response
+
+    @classmethod
+    def from_stream(
+        cls,
+        stream: typing.BinaryIO,
+        extension: str | None = None,
+        **kwargs: typing.Any,
+    ) -> SpooledContentResource:
+        """Create a resource from a binary stream.
+
+        The stream is copied and hashed in blocks rather than read into memory
+        up front. See `SpooledContentResource`.
+
+        Parameters
+        ----------
+        stream : typing.BinaryIO
+            The stream to serve. It is consumed, but not closed.
+        extension : str, optional
+            The extension to use for the resource identifier.
+        kwargs : dict
+            Additional keyword arguments to pass to the Resource constructor.
+        """
+        return SpooledContentResource(stream, extension=extension, **kwargs)
+
+
+class SpooledContentResource(Resource):
+    """Serve the contents of a binary stream as a resource.
+
+    The contents are kept in a spooled temporary file, so only payloads smaller
+    than the spool threshold (8 MiB) are held in memory.
+    """
+
+    def __init__(
+        self,
+        stream: typing.BinaryIO,
+        extension: str | None = None,
+        **kwargs: typing.Any,
+    ):
+        """Create a new SpooledContentResource.
+
+        Parameters
+        ----------
+        stream : typing.BinaryIO
+            The stream to serve. It is consumed, but not closed.
+        extension : str, optional
+            The extension to use for the resource identifier.
+        kwargs : dict
+            Additional keyword arguments to pass to the Resource constructor.
+        """
+        super().__init__(**kwargs)
+        digest, self._file, self._size = spool_stream(stream)
+        self._lock = threading.Lock()
+        self._guid = f"{digest[:7]}-content{extension or '.bin'}"
+        self._media_type = guess_media_type(self._guid)
+        self._validators = _content_validators(digest)
+        self._response_headers = {**self._validators, **self.headers}
+
+    def get(self, request: Request) -> Response:
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, self._validators["ETag"]):
+            return Response(status_code=304, headers=self._validators)
+        response = StreamingResponse(
+            read_spooled_blocks(self._file, self._lock, self._size, self.block_size),
+            media_type=self._media_type,
+            headers=self._response_headers,
+        )
+        response.headers["content-length"] = str(self._size)
+        return response
+
+
+def resource_endpoint(
+    request: Request, resources: typing.Mapping[str, Resource]
+) -> Response:
+    """Request handler for the resources/ endpoint.
+
+    Parameters
+    ----------
+    request : Request
+        The request.
+    resources : typing.Mapping[str, Resource]
+        A mapping of resource identifiers to resources.
+
+    Returns
+    -------
+    Response
+        The server response.
+    """
+    path = request.path_params["path"]
+    resource = resources.get(path.split("/")[0])
+    if resource is None:
+        return Response(status_code=404)
+    return resource.get(request)
 
 
 def create_resource_route(resources: typing.Mapping[str, Resource]) -> Mount:
     """Create a route for serving resources.
 
+    The mount dispatches to resources directly from the ASGI scope, rather than
+    through a Starlette `Route`, since the only path parameter is the trailing
+    path.
+
     Parameters
     ----------
     resources : typing.Mapping[str, Resource]
@@ -172,28 +349,43 @@ def create_resource_route(resources: typing.Mapping[str, Resource]) -> Mount:
         A route for serving resources.
     """
 
-    def endpoint(request: Request) -> Response:
-        path = request.path_params["path"]
-        guid = path.split("/")[0]
-        return resources[guid].get(request)
-
-    return Mount(
-        path="/resources",
-        routes=[
-            Route("/{path:path}", endpoint, methods=["GET", "HEAD"]),
-        ],
-    )
+    async def app(scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await WebSocketClose()(scope, receive, send)
+            return
+
+        response: Response
+        if scope["method"] not in ("GET", "HEAD"):
+            response = PlainTextResponse(
+                "Method Not Allowed", status_code=405, headers={"Allow": "GET, HEAD"}
+            )
+        else:
+            # depending on the Starlette version, the mount prefix is either
+            # stripped from the path or recorded in the root path
+            path: str = scope["path"]
+            root_path: str = scope.get("root_path", "")
+            if root_path and path.startswith(root_path):
+                path = path[len(root_path) :]
+            request = Request(
+                {**scope, "path_params": {"path": path.lstrip("/")}}, receive
+            )
+            response = await run_in_threadpool(resource_endpoint, request, resources)
+        await response(scope, receive, send)
+
+    return Mount(path="/resources", app=app)
 
 
 def create_resource(
-    x: pathlib.Path | str, provider: ProviderProtocol, **kwargs: typing.Any
+    x: pathlib.Path | str | typing.BinaryIO,
+    provider: ProviderProtocol,
+    **kwargs: typing.Any,
 ) -> Resource:
-    """Create a resource from a path or string.
+    """Create a resource from a path, string or binary stream.
 
     Parameters
     ----------
-    x : pathlib.Path | str
-        The path or string to create a resource from.
+    x : pathlib.Path | str | typing.BinaryIO
+        The path, string or binary stream to create a resource from.
     provider : ProviderProtocol
         The provider that will serve the resource.
     kwargs : dict
@@ -206,6 +398,15 @@ def create_resource(
     """
     if isinstance(x, str):
         return ContentResource(x, provider=provider, **kwargs)
+    if isinstance(x, io.TextIOBase):
+        raise TypeError(
+            "Text streams are not supported. Pass the text as a str, "
+            "or open the file in binary mode."
+        )
+    if isinstance(x, io.IOBase):
+        return ContentResource.from_stream(
+            typing.cast(typing.BinaryIO, x), provider=provider, **kwargs
+        )
     if isinstance(x, pathlib.Path) and x.is_file():
         return FileResource(x, provider=provider, **kwargs)
     if isinstance(x, pathlib.Path) and x.is_dir():
@@ -1,15 +1,20 @@
 from __future__ import annotations
 
-import itertools
+import asyncio
+import collections
+import functools
+import threading
 import typing
 
+from anyio import to_thread
 from starlette.middleware import Middleware
+from starlette.middleware.gzip import GZipMiddleware
 from starlette.requests import Request
-from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.responses import PlainTextResponse, Response
 from starlette.routing import Mount, Route
-from starlette.types import ASGIApp, Receive, Scope, Send
 
 from servir._protocols import ProviderProtocol, TilesetProtocol
+from servir._util import ORJSONResponse, dumps_json_member, iter_json_object
 
 # HiGlass
 
@@ -19,10 +24,26 @@ _MOUNT_PATH = "/tilesets/api/v1/"
 TilesetType = typing.TypeVar("TilesetType", bound=TilesetProtocol)
 
 
+class _TileBatch:
+    """The tile ids requested within one coalescing window, and their waiters."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.tile_ids: dict[str, None] = {}
+        self.waiters: list[asyncio.Future[dict[str, bytes]]] = []
+
+
 class TilesetResource(typing.Generic[TilesetType]):
     """A tileset resource."""
 
-    def __init__(self, tileset: TilesetType, provider: ProviderProtocol):
+    def __init__(
+        self,
+        tileset: TilesetType,
+        provider: ProviderProtocol,
+        cacheable: bool = True,
+        max_cache_size: int = 16 << 20,
+        batch_delay: float | None = 0.001,
+    ):
         """Initialize a tileset resource.
 
         Parameters
@@ -31,9 +52,31 @@ class TilesetResource(typing.Generic[TilesetType]):
             The tileset.
         provider : ProviderProtocol
             The server provider.
+        cacheable : bool, optional
+            Whether the tileset info and tiles can be cached after they are first
+            requested (default: True). Disable for tilesets that change over time.
+        max_cache_size : int, optional
+            The maximum total size, in bytes, of the serialized tiles to cache
+            (default: 16 MiB). The least recently requested are discarded first.
+        batch_delay : float, optional
+            How long, in seconds, to collect concurrent tile requests before
+            fetching their tiles from the tileset in one call (default: 0.001).
+            If None, each request fetches its own tiles.
         """
         self._tileset = tileset
         self._provider = provider
+        self._cacheable = cacheable
+        self._info: typing.Any = None
+        self._serialized_info: bytes | None = None
+        self._max_cache_size = max_cache_size
+        self._tiles: collections.OrderedDict[str, bytes] = collections.OrderedDict()
+        self._tiles_size = 0
+        self._tiles_lock = threading.Lock()
+        self._batch_delay = batch_delay
+        self._batch: _TileBatch | None = None
+        self._batch_tasks: set[asyncio.Task[None]] = set()
+        self._server_base: str | None = None
+        self._server = ""
 
     @property
     def tileset(self) -> TilesetType:
@@ -45,34 +88,151 @@ class TilesetResource(typing.Generic[TilesetType]):
         """The unique identifier for the tileset."""
         return self._tileset.uid
 
-    @property
-    def server(self) -> str:
-        """The server url."""
-        return f"{self._provider.url}{_MOUNT_PATH}"
+    def info(self) -> typing.Any:
+        """Get the tileset info, cached if the resource is cacheable."""
+        if not self._cacheable:
+            return self._tileset.info()
+        if self._info is None:
+            self._info = self._tileset.info()
+        return self._info
 
+    def serialized_info(self) -> bytes:
+        """Get the tileset info as a serialized JSON object member, `b'"uid":{...}'`.
 
-def get_list(query: str, field: str) -> list[str]:
-    """Parse chained query params into list.
+        The serialized info is cached if the resource is cacheable.
+        """
+        if not self._cacheable:
+            return dumps_json_member(self.uid, self._tileset.info())
+        if self._serialized_info is None:
+            self._serialized_info = dumps_json_member(self.uid, self.info())
+        return self._serialized_info
 
-    Parameters
-    ----------
-    query : str
-        The query string. For example, "d=id1&d=id2&d=id3".
-    field : str
-        The field to extract. For example, "d".
+    def serialized_tiles(self, tile_ids: typing.Sequence[str]) -> list[bytes]:
+        """Fetch tiles as serialized JSON object members, e.g. `b'"tid":{...}'`.
 
-    Returns
-    -------
-    list[str]
-        The list of values for the given field. For example, ['id1', 'id2', 'id3'].
-    """
-    kv_tuples = [x.split("=") for x in query.split("&")]
-    return [v for k, v in kv_tuples if k == field]
+        Only the tiles that are not cached are requested from the tileset.
+
+        Parameters
+        ----------
+        tile_ids : typing.Sequence[str]
+            The tile ids to fetch.
+
+        Returns
+        -------
+        list[bytes]
+            The serialized tiles.
+        """
+        return list(self._serialized_tiles_by_id(tile_ids).values())
 
+    async def coalesced_serialized_tiles(
+        self, tile_ids: typing.Sequence[str]
+    ) -> list[bytes]:
+        """Fetch tiles as serialized JSON object members, batching concurrent calls.
 
-def tileset_info(
+        Calls made within `batch_delay` of each other are served by a single
+        call to the tileset, in a worker thread. Tiles are matched to calls by
+        their ids.
+
+        Parameters
+        ----------
+        tile_ids : typing.Sequence[str]
+            The tile ids to fetch.
+
+        Returns
+        -------
+        list[bytes]
+            The serialized tiles.
+        """
+        if self._batch_delay is None:
+            return await to_thread.run_sync(self.serialized_tiles, tile_ids)
+
+        loop = asyncio.get_running_loop()
+        batch = self._batch
+        # a batch is bound to the loop it was started on, e.g. across restarts
+        if batch is None or batch.loop is not loop:
+            batch = self._batch = _TileBatch(loop)
+            # fetch in a separate task, so a waiter going away doesn't cancel it
+            task = loop.create_task(self._fetch_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+        batch.tile_ids.update(dict.fromkeys(tile_ids))
+        waiter: asyncio.Future[dict[str, bytes]] = loop.create_future()
+        batch.waiters.append(waiter)
+        tiles = await waiter
+        return [tiles[tid] for tid in dict.fromkeys(tile_ids) if tid in tiles]
+
+    async def _fetch_batch(self, batch: _TileBatch) -> None:
+        try:
+            await asyncio.sleep(typing.cast(float, self._batch_delay))
+            if self._batch is batch:
+                self._batch = None
+            tile_ids = list(batch.tile_ids)
+            tiles = await to_thread.run_sync(self._serialized_tiles_by_id, tile_ids)
+        except Exception as e:
+            # raised to each waiter, rather than from this task
+            for waiter in batch.waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+        else:
+            for waiter in batch.waiters:
+                if not waiter.done():
+                    waiter.set_result(tiles)
+        finally:
+            if self._batch is batch:
+                self._batch = None
+            for waiter in batch.waiters:
+                waiter.cancel()
+
+    def _serialized_tiles_by_id(self, tile_ids: typing.Sequence[str]) -> dict[str, bytes]:
+        if not self._cacheable or self._max_cache_size <= 0:
+            return {
+                tid: dumps_json_member(tid, value)
+                for tid, value in self._tileset.tiles(tile_ids)
+            }
+
+        with self._tiles_lock:
+            cached = {tid: self._tiles[tid] for tid in tile_ids if tid in self._tiles}
+            for tid in cached:
+                self._tiles.move_to_end(tid)
+        missing = [tid for tid in tile_ids if tid not in cached]
+        if not missing:
+            return cached
+
+        fetched = {
+            tid: dumps_json_member(tid, value)
+            for tid, value in self._tileset.tiles(missing)
+        }
+        with self._tiles_lock:
+            for tid, tile in fetched.items():
+                # the tile may have been fetched concurrently by another request
+                self._tiles_size -= len(self._tiles.pop(tid, b""))
+                self._tiles[tid] = tile
+                self._tiles_size += len(tile)
+            while self._tiles_size > self._max_cache_size:
+                self._tiles_size -= len(self._tiles.popitem(last=False)[1])
+        return {**cached, **fetched}
+
+    def refresh(self) -> None:
+        """Discard the cached tileset info and tiles."""
+        self._info = None
+        self._serialized_info = None
+        with self._tiles_lock:
+            self._tiles.clear()
+            self._tiles_size = 0
+
+    @property
+    def server(self) -> str:
+        """The server url."""
+        base = self._provider.url
+        if base is not self._server_base:
+            self._server_base = base
+            self._server = f"{base}{_MOUNT_PATH}"
+        return self._server
+
+
+async def tileset_info(
     request: Request, tilesets: typing.Mapping[str, TilesetResource[TilesetProtocol]]
-) -> JSONResponse:
+) -> Response:
     """Request handler for the tileset_info/ endpoint.
 
     Parameters
@@ -84,22 +244,28 @@ def tileset_info(
 
     Returns
     -------
-    JSONResponse
+    Response
         The server response.
     """
-    uids = get_list(request.url.query, "d")
-    info = {
-        uid: tilesets[uid].tileset.info()
-        if uid in tilesets
-        else {"error": f"No such tileset with uid: {uid}"}
+    uids = dict.fromkeys(request.query_params.getlist("d"))
+    # hold each tileset for the whole request, even if it is released meanwhile
+    found = {uid: tilesets[uid] for uid in uids if uid in tilesets}
+    # tilesets may read from disk, so query them concurrently off the event loop
+    results = await asyncio.gather(
+        *(to_thread.run_sync(resource.serialized_info) for resource in found.values())
+    )
+    info = dict(zip(found, results))
+    members = [
+        info.get(uid)
+        or dumps_json_member(uid, {"error": f"No such tileset with uid: {uid}"})
         for uid in uids
-    }
-    return JSONResponse(info)
+    ]
+    return Response(b"".join(iter_json_object([members])), media_type="application/json")
 
 
-def tiles(
+async def tiles(
     request: Request, tilesets: typing.Mapping[str, TilesetResource[TilesetProtocol]]
-) -> JSONResponse:
+) -> Response:
     """Request handler for the tiles/ endpoint.
 
     Parameters
@@ -111,30 +277,43 @@ def tiles(
 
     Returns
     -------
-    JSONResponse
-        The server response.
+    Response
+        The server response, with the tiles as a JSON object.
     """
-    requested_tids = set(get_list(request.url.query, "d"))
+    requested_tids = dict.fromkeys(request.query_params.getlist("d"))
     if not requested_tids:
-        return JSONResponse({"error": "No tiles requested"}, 400)
-
-    tiles: list[typing.Any] = []
-    for uid, tids in itertools.groupby(
-        iterable=sorted(requested_tids), key=lambda tid: tid.split(".")[0]
-    ):
-        tileset_resource = tilesets.get(uid)
-        if not tileset_resource:
-            return JSONResponse(
+        return ORJSONResponse({"error": "No tiles requested"}, 400)
+
+    # bucket the (deduplicated) tile ids by tileset in a single pass
+    buckets: dict[str, list[str]] = {}
+    for tid in requested_tids:
+        buckets.setdefault(tid.partition(".")[0], []).append(tid)
+
+    # validate every uid before fetching any tiles
+    resources = []
+    for uid in buckets:
+        resource = tilesets.get(uid)
+        if resource is None:
+            return ORJSONResponse(
                 {"error": f"No tileset found for requested uid: {uid}"}, 400
             )
-        tiles.extend(tileset_resource.tileset.tiles(list(tids)))
-    data = {tid: tval for tid, tval in tiles}
-    return JSONResponse(data)
+        resources.append(resource)
+
+    # each tileset is queried (and its tiles serialized) concurrently in a worker
+    # thread, batched with other requests for the same tileset
+    groups = await asyncio.gather(
+        *(
+            resource.coalesced_serialized_tiles(tids)
+            for resource, tids in zip(resources, buckets.values())
+        )
+    )
+    # every tile is serialized by now, so send one body with a content-length
+    return Response(b"".join(iter_json_object(groups)), media_type="application/json")
 
 
-def chromsizes(
+async def chromsizes(
     request: Request, tilesets: typing.Mapping[str, TilesetResource[TilesetProtocol]]
-) -> PlainTextResponse | JSONResponse:
+) -> PlainTextResponse | ORJSONResponse:
     """Request handler for the chrom-sizes/ endpoint.
 
     Chromsizes are returned as a plain text response, as a TSV:
@@ -152,70 +331,48 @@ def chromsizes(
 
     Returns
     -------
-    PlainTextResponse | JSONResponse
+    PlainTextResponse | ORJSONResponse
         The server response. If the tileset does not have chromsizes, a JSON
         response with an error message is returned.
     """
     uid = request.query_params.get("id")
     if uid is None:
-        return JSONResponse({"error": "No uid provided."}, 400)
-    tileset_resource = tilesets[uid]
-    info = tileset_resource.tileset.info()
+        return ORJSONResponse({"error": "No uid provided."}, 400)
+    tileset_resource = tilesets.get(uid)
+    if tileset_resource is None:
+        return ORJSONResponse({"error": f"No such tileset with uid: {uid}"}, 404)
+    info = await to_thread.run_sync(tileset_resource.info)
     assert "chromsizes" in info, "No chromsizes in tileset info"
     return PlainTextResponse(
         "\n".join(f"{chrom}\t{size}" for chrom, size in info["chromsizes"])
     )
 
 
-TilesetEndpoint = typing.Callable[
-    [Request, typing.Mapping[str, TilesetResource[TilesetProtocol]]], Response
-]
-
-
 def create_tileset_route(
-    tileset_resources: typing.Mapping[str, TilesetResource[TilesetProtocol]],
-    scope_id: str = "tilesets",
+    tilesets: typing.Mapping[str, TilesetResource[TilesetProtocol]],
 ) -> Mount:
     """Create a route for tileset endpoints.
 
+    The tileset resources are bound to each request handler when the route is
+    created.
+
     Parameters
     ----------
-    tileset_resources : typing.Mapping[str, TilesetResource]
+    tilesets : typing.Mapping[str, TilesetResource]
         The tileset resources.
-    scope_id : str, optional
-        The scope id to use for passing the tileset resources to the
-        request handlers, by default "tilesets".
 
     Returns
     -------
     Mount
         The API route.
     """
-
-    class TilesetMiddleware:
-        """Middleware to inject tileset resources into request scope."""
-
-        def __init__(self, app: ASGIApp) -> None:
-            self.app = app
-
-        async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
-            scope[scope_id] = tileset_resources
-            await self.app(scope, receive, send)
-
-    def inject_tilesets(func: TilesetEndpoint) -> typing.Callable[[Request], Response]:
-        """Inject tileset resources as secondrequest handler."""
-
-        def wrapper(request: Request) -> Response:
-            return func(request, request.scope[scope_id])
-
-        return wrapper
-
     return Mount(
         path=_MOUNT_PATH,
+        # tile JSON compresses well, and unlike files these responses aren't ranged
+        middleware=[Middleware(GZipMiddleware, minimum_size=1024, compresslevel=4)],
         routes=[
-            Route("/tileset_info/", inject_tilesets(tileset_info)),
-            Route("/tiles/", inject_tilesets(tiles)),
-            Route("/chrom-sizes/", inject_tilesets(chromsizes)),
+            Route("/tileset_info/", functools.partial(tileset_info, tilesets=tilesets)),
+            Route("/tiles/", functools.partial(tiles, tilesets=tilesets)),
+            Route("/chrom-sizes/", functools.partial(chromsizes, tilesets=tilesets)),
         ],
-        middleware=[Middleware(TilesetMiddleware)],
     )
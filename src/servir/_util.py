@@ -1,31 +1,169 @@
 from __future__ import annotations
 
 import dataclasses
+import email.utils
+import functools
 import hashlib
+import json
 import mimetypes
+import os
 import pathlib
-import re
+import tempfile
+import threading
 import typing
 
-from starlette.responses import FileResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.types import Receive, Scope, Send
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore[assignment]
 
-def md5(data: str | bytes) -> str:
+# Size of the blocks in which file bodies are read and sent. Large blocks amortize
+# the per-chunk dispatch cost of the ASGI send loop.
+BLOCK_SIZE = 1 << 20
+SPOOL_MAX_SIZE = 8 << 20
+# Ranges up to this size are read and sent in one message, rather than streamed.
+SMALL_RANGE_SIZE = 64 << 10
+
+_ACCEPT_RANGES_HEADER = (b"accept-ranges", b"bytes")
+
+# Load the system mime type database now rather than on the first request.
+if not mimetypes.inited:
+    mimetypes.init()
+
+
+def content_hash(data: str | bytes) -> str:
     """Generate a unique identifier for a string or bytes.
 
+    Uses BLAKE2b, which is considerably faster than MD5 in CPython. The hash is
+    only used to mint identifiers, so cryptographic strength is not a concern.
+
     Parameters
     ----------
-    string : str
-        The string to hash.
+    data : str | bytes
+        The string or bytes to hash.
 
     Returns
     -------
     str :
-        A unique identifier for the string.
+        A unique identifier for the string or bytes.
     """
     if isinstance(data, str):
+        if len(data) <= 4096:
+            return _str_content_hash(data)
         data = data.encode()
-    return hashlib.md5(data).hexdigest()
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+@functools.lru_cache(maxsize=1024)
+def _str_content_hash(data: str) -> str:
+    # only small strings are cached, to bound the memory retained by the cache
+    return hashlib.blake2b(data.encode(), digest_size=16).hexdigest()
+
+
+class PrebuiltResponse(Response):
+    """A response that is rendered once and can be sent any number of times.
+
+    The body and headers are encoded at construction, so sending the response
+    only replays the two ASGI messages.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Send the response."""
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                # middleware may modify the headers of the sent message in place
+                "headers": list(self.raw_headers),
+            }
+        )
+        await send({"type": "http.response.body", "body": self.body})
+
+
+def dumps_json(content: typing.Any) -> bytes:
+    """Serialize content as compact JSON bytes.
+
+    Uses `orjson` when it is installed, which serializes in C and handles numpy
+    arrays natively. Otherwise matches Starlette's `JSONResponse` rendering.
+
+    Parameters
+    ----------
+    content : typing.Any
+        The content to serialize.
+
+    Returns
+    -------
+    bytes
+        The UTF-8 encoded JSON.
+    """
+    if orjson is None:
+        return json.dumps(
+            content, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        ).encode("utf-8")
+    return orjson.dumps(
+        content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    )
+
+
+def dumps_json_member(key: str, value: typing.Any) -> bytes:
+    """Serialize a key-value pair as a JSON object member, e.g. `b'"key":value'`.
+
+    Parameters
+    ----------
+    key : str
+        The member name.
+    value : typing.Any
+        The member value.
+
+    Returns
+    -------
+    bytes
+        The UTF-8 encoded member.
+    """
+    return dumps_json(key) + b":" + dumps_json(value)
+
+
+def iter_json_object(
+    groups: typing.Iterable[typing.Iterable[bytes]],
+) -> typing.Iterator[bytes]:
+    """Join serialized members into a JSON object, one chunk per group.
+
+    Members are joined as they are, so no member is serialized again.
+
+    Parameters
+    ----------
+    groups : typing.Iterable[typing.Iterable[bytes]]
+        The members of the object, in groups, as from `dumps_json_member`.
+
+    Yields
+    ------
+    bytes
+        The next chunk of the JSON object.
+    """
+    sep = b"{"
+    for group in groups:
+        chunk = b",".join(group)
+        if chunk:
+            yield sep + chunk
+            sep = b","
+    yield b"{}" if sep == b"{" else b"}"
+
+
+class ORJSONResponse(JSONResponse):
+    """A JSON response rendered with `orjson` when it is installed.
+
+    `orjson` serializes in C and handles numpy arrays natively, which makes it
+    considerably faster than the standard library for large tile payloads. Falls
+    back to Starlette's `JSONResponse` rendering otherwise.
+    """
+
+    def render(self, content: typing.Any) -> bytes:
+        """Render the content as JSON bytes."""
+        return dumps_json(content)
 
 
 def create_resource_identifier(data: str | bytes, id: str) -> str:
@@ -43,7 +181,35 @@ def create_resource_identifier(data: str | bytes, id: str) -> str:
     str :
         A unique identifier for the string or bytes.
     """
-    return f"{md5(data)[:7]}-{id}"
+    return f"{content_hash(data)[:7]}-{id}"
+
+
+def create_path_identifier(path: pathlib.Path) -> str:
+    """Create a unique identifier for a file or directory path.
+
+    Identifiers are derived from the absolute path as given, without resolving
+    symlinks, so that no filesystem access is needed. Two links to the same file
+    get distinct identifiers, matching the names they were requested by.
+    Identifiers are memoized, so repeatedly creating resources for the same path
+    skips hashing it.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        The path to identify.
+
+    Returns
+    -------
+    str :
+        A unique identifier for the path.
+    """
+    return _path_identifier(os.path.abspath(path))
+
+
+@functools.lru_cache(maxsize=4096)
+def _path_identifier(abspath: str) -> str:
+    path = pathlib.PurePath(abspath)
+    return create_resource_identifier(data=path.as_posix(), id=path.name)
 
 
 def read_file_byte_range(path: pathlib.Path, start: int, end: int) -> bytes:
@@ -52,8 +218,120 @@ def read_file_byte_range(path: pathlib.Path, start: int, end: int) -> bytes:
         return file.read(end - start)
 
 
+def read_file_blocks(
+    path: pathlib.Path, start: int, end: int, block_size: int = BLOCK_SIZE
+) -> typing.Iterator[bytes]:
+    """Read a byte range of a file in blocks.
+
+    The file is opened once and read incrementally, so the full range is never
+    held in memory. The file is read rather than memory-mapped, since touching
+    a mapping of a file truncated meanwhile kills the process with SIGBUS.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        The path to the file.
+    start : int
+        The first byte to read.
+    end : int
+        The byte at which to stop reading (exclusive).
+    block_size : int, optional
+        The maximum size of each block, by default 1 MiB.
+
+    Yields
+    ------
+    bytes
+        The next block of the file.
+    """
+    with path.open("rb") as file:
+        file.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = file.read(min(block_size, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+
+def spool_stream(
+    stream: typing.BinaryIO,
+    block_size: int = BLOCK_SIZE,
+    max_size: int = SPOOL_MAX_SIZE,
+) -> tuple[str, typing.IO[bytes], int]:
+    """Copy a binary stream into a spooled temporary file, hashing as it goes.
+
+    The stream is consumed in blocks, so at most `max_size` bytes are held in
+    memory; larger payloads are rolled over to disk.
+
+    Parameters
+    ----------
+    stream : typing.BinaryIO
+        The stream to read from.
+    block_size : int, optional
+        The size of each read, by default 1 MiB.
+    max_size : int, optional
+        The size at which the spool is rolled over to disk, by default 8 MiB.
+
+    Returns
+    -------
+    tuple[str, typing.IO[bytes], int]
+        The content hash, the spooled file and the number of bytes copied.
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    # the spool is owned by the caller, which serves from it for its lifetime
+    spool = tempfile.SpooledTemporaryFile(max_size=max_size)
+    size = 0
+    for block in iter(lambda: stream.read(block_size), b""):
+        hasher.update(block)
+        spool.write(block)
+        size += len(block)
+    return hasher.hexdigest(), typing.cast(typing.IO[bytes], spool), size
+
+
+def read_spooled_blocks(
+    file: typing.IO[bytes],
+    lock: threading.Lock,
+    size: int,
+    block_size: int = BLOCK_SIZE,
+) -> typing.Iterator[bytes]:
+    """Read a file shared between requests in blocks.
+
+    Each read seeks to its own offset under `lock`, so concurrent responses
+    never observe each other's file position.
+
+    Parameters
+    ----------
+    file : typing.IO[bytes]
+        The shared file.
+    lock : threading.Lock
+        The lock guarding the file position.
+    size : int
+        The number of bytes to read.
+    block_size : int, optional
+        The maximum size of each block, by default 1 MiB.
+
+    Yields
+    ------
+    bytes
+        The next block of the file.
+    """
+    offset = 0
+    while offset < size:
+        with lock:
+            file.seek(offset)
+            block = file.read(min(block_size, size - offset))
+        if not block:
+            break
+        offset += len(block)
+        yield block
+
+
 @dataclasses.dataclass(frozen=True)
 class ContentRange:
+    # `slots=True` needs Python 3.10, so the slots are declared by hand
+    __slots__ = ("end", "start")
+
     start: int
     end: int | None
 
@@ -73,68 +351,286 @@ class ContentRange:
         tuple[int, int]
             The start and end of the byte-range.
         """
-        content_range_header = header.strip().lower()
-
-        match = re.match(r"^bytes=(\d+)-(\d+)?,?$", content_range_header)
-
-        if not match:
+        unit, _, byte_range = header.strip().partition("=")
+        if byte_range.endswith(","):
+            byte_range = byte_range[:-1]
+        range_start, sep, range_end = byte_range.partition("-")
+
+        if (
+            unit.lower() != "bytes"
+            or not sep
+            or not range_start.isdigit()
+            or (range_end and not range_end.isdigit())
+        ):
             raise ValueError("Invalid 'Range' header. Must be of the form 'bytes=0-499'.")
 
-        range_start, range_end = match.groups()
         return cls(
             start=int(range_start),
             end=int(range_end) if range_end else None,
         )
 
 
+def file_stat_headers(stat_result: os.stat_result) -> dict[str, str]:
+    """Create validator headers for a file.
+
+    Parameters
+    ----------
+    stat_result : os.stat_result
+        The result of `os.stat` for the file.
+
+    Returns
+    -------
+    dict[str, str]
+        The `ETag` and `Last-Modified` headers, along with a `Cache-Control`
+        header asking clients to revalidate before reusing a cached copy.
+    """
+    return {
+        "Cache-Control": "no-cache",
+        "ETag": f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"',
+        "Last-Modified": email.utils.formatdate(stat_result.st_mtime, usegmt=True),
+    }
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Check whether an 'If-None-Match' header matches an ETag.
+
+    Uses the weak comparison required for 'If-None-Match'.
+
+    Parameters
+    ----------
+    if_none_match : str
+        The 'If-None-Match' header.
+    etag : str
+        The current ETag of the resource.
+
+    Returns
+    -------
+    bool
+        Whether the client's cached representation is still valid.
+    """
+    if if_none_match.strip() == "*":
+        return True
+    etag = etag[2:] if etag.startswith("W/") else etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if (tag[2:] if tag.startswith("W/") else tag) == etag:
+            return True
+    return False
+
+
+class FileRangeResponse(StreamingResponse):
+    """Stream a byte range of a file.
+
+    Ranges of up to `SMALL_RANGE_SIZE` bytes are read and sent in one message.
+    Larger ranges are handed to the server to send with `os.sendfile` if it
+    supports the `http.response.zerocopysend` extension, and are otherwise
+    streamed in blocks.
+    """
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        start: int,
+        end: int,
+        status_code: int = 200,
+        media_type: str | None = None,
+        headers: typing.Mapping[str, str] | None = None,
+        head: bool = False,
+        block_size: int = BLOCK_SIZE,
+    ) -> None:
+        """Create a new FileRangeResponse.
+
+        Parameters
+        ----------
+        path : pathlib.Path
+            The path to the file.
+        start : int
+            The first byte to send.
+        end : int
+            The byte at which to stop sending (exclusive).
+        status_code : int, optional
+            The response status code, by default 200.
+        media_type : str, optional
+            The media type of the response.
+        headers : typing.Mapping[str, str], optional
+            Additional headers to include in the response.
+        head : bool, optional
+            Whether to only send the headers, by default False.
+        block_size : int, optional
+            The size of the blocks the range is streamed in, by default 1 MiB.
+        """
+        super().__init__(
+            # HEAD responses only need the headers, so don't open the file at all
+            content=[]
+            if head
+            else read_file_blocks(path, start=start, end=end, block_size=block_size),
+            status_code=status_code,
+            media_type=media_type,
+            headers=headers,
+        )
+        self.path = path
+        self.start = start
+        self.count = max(end - start, 0)
+        self.head = head
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Send the response."""
+        if self.head:
+            return await super().__call__(scope, receive, send)
+        if self.count <= SMALL_RANGE_SIZE:
+            # a single read is cheaper than streaming or sendfile for small ranges
+            body = await run_in_threadpool(
+                read_file_byte_range, self.path, self.start, self.start + self.count
+            )
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": self.status_code,
+                    "headers": self.raw_headers,
+                }
+            )
+            await send({"type": "http.response.body", "body": body})
+            return None
+        if "http.response.zerocopysend" not in scope.get("extensions", {}):
+            return await super().__call__(scope, receive, send)
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+        # opening may block on slow or networked filesystems
+        file = await run_in_threadpool(self.path.open, "rb")
+        with file:
+            await send(
+                {
+                    "type": "http.response.zerocopysend",
+                    "file": file,
+                    "offset": self.start,
+                    "count": self.count,
+                    "more_body": False,
+                }
+            )
+
+
 def create_streaming_file_response(
     path: pathlib.Path,
     content_range: ContentRange | None = None,
     media_type: str | None = None,
     headers: None | typing.Mapping[str, str] = None,
-) -> StreamingResponse:
-    file_size = path.stat().st_size
+    stat_result: os.stat_result | None = None,
+    head: bool = False,
+    block_size: int = BLOCK_SIZE,
+) -> FileRangeResponse:
+    file_size = (stat_result or path.stat()).st_size
 
     if not content_range:
         start, end = (0, file_size - 1)
         status_code = 200
-        headers = {
-            **(headers or {}),
-        }
-        content = path.read_bytes()
+        range_headers = []
     else:
         status_code = 206
-        start, end = (content_range.start, content_range.end or file_size - 1)
-        headers = {
-            **(headers or {}),
-            "Content-Range": f"bytes {start}-{end}/{file_size}",
-            "Accept-Ranges": "bytes",
-        }
-        content = read_file_byte_range(path, start=start, end=end + 1)
-
-    headers["Content-Length"] = str(len(content))
-
-    return StreamingResponse(
-        content=[content],
-        media_type=media_type,
+        start = content_range.start
+        end = file_size - 1 if content_range.end is None else content_range.end
+        end = min(end, file_size - 1)
+        range_headers = [
+            (b"content-range", b"bytes %d-%d/%d" % (start, end, file_size)),
+            _ACCEPT_RANGES_HEADER,
+        ]
+
+    response = FileRangeResponse(
+        path,
+        start=start,
+        end=end + 1,
         status_code=status_code,
+        media_type=media_type,
         headers=headers,
+        head=head,
+        block_size=block_size,
+    )
+    # append pre-encoded headers directly rather than formatting and encoding strs
+    response.raw_headers.extend(range_headers)
+    response.raw_headers.append((b"content-length", b"%d" % response.count))
+    return response
+
+
+def create_range_not_satisfiable_response(
+    file_size: int, headers: typing.Mapping[str, str] | None = None
+) -> Response:
+    """Create a 416 response for a malformed or unsatisfiable 'Range' header.
+
+    Parameters
+    ----------
+    file_size : int
+        The size of the requested file, reported in the 'Content-Range' header.
+    headers : typing.Mapping[str, str], optional
+        Additional headers to include in the response.
+
+    Returns
+    -------
+    Response
+        The 'Range Not Satisfiable' response.
+    """
+    return Response(
+        status_code=416,
+        headers={**(headers or {}), "content-range": f"bytes */{file_size}"},
     )
 
 
+def _is_byte_range(header: str) -> bool:
+    return header.partition("=")[0].strip().lower() == "bytes"
+
+
 def create_file_response(
     path: pathlib.Path,
     content_range_header: str | None = None,
-) -> FileResponse | StreamingResponse:
-    media_type = guess_media_type(path)
+    media_type: str | None = None,
+    stat_result: os.stat_result | None = None,
+    headers: typing.Mapping[str, str] | None = None,
+    head: bool = False,
+    block_size: int = BLOCK_SIZE,
+) -> Response:
+    media_type = media_type or guess_media_type(path)
+    if content_range_header and not _is_byte_range(content_range_header):
+        # a range in a unit other than bytes must be ignored (RFC 9110, section
+        # 14.2). The whole file is sent by a response that doesn't reparse the
+        # header, since Starlette's FileResponse rejects other units from 0.39.
+        return create_streaming_file_response(
+            path=path,
+            media_type=media_type,
+            headers=headers,
+            stat_result=stat_result,
+            head=head,
+            block_size=block_size,
+        )
     if content_range_header:
-        content_range = ContentRange.parse_header(content_range_header)
+        stat_result = stat_result or path.stat()
+        try:
+            content_range = ContentRange.parse_header(content_range_header)
+        except ValueError:
+            return create_range_not_satisfiable_response(stat_result.st_size, headers)
+        if content_range.start >= stat_result.st_size or (
+            content_range.end is not None and content_range.end < content_range.start
+        ):
+            return create_range_not_satisfiable_response(stat_result.st_size, headers)
         return create_streaming_file_response(
             path=path,
             content_range=content_range,
             media_type=media_type,
+            headers=headers,
+            stat_result=stat_result,
+            head=head,
+            block_size=block_size,
         )
-    return FileResponse(path=path, media_type=media_type)
+    response = FileResponse(
+        path=path,
+        media_type=media_type,
+        headers=headers,
+        stat_result=stat_result,
+    )
+    response.chunk_size = block_size
+    return response
 
 
 def guess_media_type(path: str | pathlib.Path) -> str:
@@ -150,4 +646,18 @@ def guess_media_type(path: str | pathlib.Path) -> str:
     str
         The media type.
     """
-    return mimetypes.guess_type(path)[0] or "application/octet-stream"
+    name = os.path.basename(os.fspath(path))
+    dot = name.find(".")
+    return _guess_media_type_for_suffix(name[dot:] if dot != -1 else "")
+
+
+@functools.lru_cache(maxsize=512)
+def _guess_media_type_for_suffix(suffix: str) -> str:
+    # the lookup only depends on the suffix, so it is cached per suffix
+    return mimetypes.guess_type(f"x{suffix}")[0] or "application/octet-stream"
+
+
+# Warm the cache with the suffixes most commonly served.
+for _suffix in (".bin", ".csv", ".html", ".json", ".png", ".tsv", ".txt"):
+    _guess_media_type_for_suffix(_suffix)
+del _suffix
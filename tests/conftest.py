@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import typing
+
+import pytest
+import requests
+import requests.adapters
+
+from servir._provide import Provider
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    parser.addoption(
+        "--benchmarks", action="store_true", help="run the benchmarks in test_perf.py"
+    )
+
+
+def pytest_collection_modifyitems(
+    config: pytest.Config, items: list[pytest.Item]
+) -> None:
+    # benchmarks are slow and noisy on shared runners, so they are opt-in
+    if config.getoption("--benchmarks"):
+        return
+    skip = pytest.mark.skip(reason="benchmarks only run with --benchmarks")
+    for item in items:
+        if "benchmark" in getattr(item, "fixturenames", ()):
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope="session")
+def provider() -> typing.Iterator[Provider]:
+    """A provider shared across tests, since starting a server is comparatively slow.
+
+    Tests that depend on the provider's configuration or registry size should
+    create their own.
+    """
+    provider = Provider()
+    yield provider
+    provider.stop()
+
+
+@pytest.fixture(scope="session")
+def http() -> typing.Iterator[requests.Session]:
+    """A client session, so requests reuse pooled keep-alive connections."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    yield session
+    session.close()
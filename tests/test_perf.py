@@ -0,0 +1,87 @@
+"""Benchmarks for file range responses.
+
+These only run with `--benchmarks` (e.g. `hatch run bench`), and require
+`pytest-benchmark`. To check for regressions against a saved run, use
+`hatch run bench --benchmark-compare --benchmark-compare-fail=mean:10%`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import pathlib
+import socket
+import threading
+import typing
+
+import pytest
+
+from servir._util import FileRangeResponse, read_file_blocks
+
+pytest.importorskip("pytest_benchmark")
+
+SIZE = 64 << 20
+
+
+@pytest.fixture(scope="module")
+def big_file(tmp_path_factory: pytest.TempPathFactory) -> pathlib.Path:
+    path = tmp_path_factory.mktemp("perf") / "big.bin"
+    with path.open("wb") as f:
+        f.truncate(SIZE)
+    return path
+
+
+@pytest.fixture
+def sink() -> typing.Iterator[socket.socket]:
+    """A socket whose peer discards everything sent to it.
+
+    `os.sendfile` only accepts a socket as its output on some platforms.
+    """
+    sender, receiver = socket.socketpair()
+
+    def drain() -> None:
+        while receiver.recv(1 << 20):
+            pass
+
+    thread = threading.Thread(target=drain, daemon=True)
+    thread.start()
+    yield sender
+    sender.close()
+    thread.join()
+    receiver.close()
+
+
+def send_range(
+    path: pathlib.Path, extensions: dict[str, object], sock: socket.socket
+) -> None:
+    """Send a full-file range response, writing the body to `sock`."""
+    response = FileRangeResponse(path, start=0, end=SIZE, status_code=206)
+
+    async def receive() -> typing.MutableMapping[str, typing.Any]:
+        await asyncio.sleep(10)
+        return {"type": "http.disconnect"}
+
+    async def send(message: typing.MutableMapping[str, typing.Any]) -> None:
+        if message["type"] == "http.response.zerocopysend":
+            sock.sendfile(message["file"], message["offset"], message["count"])
+        elif message["type"] == "http.response.body":
+            sock.sendall(message["body"])
+
+    scope = {"type": "http", "method": "GET", "asgi": {"spec_version": "2.4"}}
+    asyncio.run(response({**scope, "extensions": extensions}, receive, send))
+
+
+def test_read_file_blocks(big_file: pathlib.Path, benchmark: typing.Any) -> None:
+    blocks = benchmark(lambda: sum(map(len, read_file_blocks(big_file, 0, SIZE))))
+    assert blocks == SIZE
+
+
+@pytest.mark.parametrize(
+    "extensions", [{}, {"http.response.zerocopysend": {}}], ids=["stream", "sendfile"]
+)
+def test_file_range_response(
+    big_file: pathlib.Path,
+    extensions: dict[str, object],
+    sink: socket.socket,
+    benchmark: typing.Any,
+) -> None:
+    benchmark(send_range, big_file, extensions, sink)
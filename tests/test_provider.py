@@ -1,82 +1,230 @@
 from __future__ import annotations
 
+import concurrent.futures
+import gc
+import io
 import json
+import os
 import pathlib
+import shutil
 import typing
-import weakref
 
+import pytest
 import requests
 
 from servir._provide import Provider
+from servir._resources import FileResource
 from servir._tilesets import TilesetResource
 
 
-def test_files(tmp_path: pathlib.Path) -> None:
-    provider = Provider()
-
+def test_files(
+    tmp_path: pathlib.Path, provider: Provider, http: requests.Session
+) -> None:
     with open(tmp_path / "hello.txt", "w") as f:
         f.write("hello, world")
 
     server_resource = provider.create(tmp_path / "hello.txt")
-    response = requests.get(server_resource.url)
+    response = http.get(server_resource.url)
     assert response.text == "hello, world"
     assert "text/plain" in response.headers["Content-Type"]
 
-    response = requests.get(provider.url + "/foo.txt")
+    response = http.get(provider.url + "/foo.txt")
     assert response.status_code == 404
 
+    response = http.get(provider.url + "/resources/foo.txt")
+    assert response.status_code == 404
 
-def test_file_content_type_json(tmp_path: pathlib.Path) -> None:
-    provider = Provider()
+    response = http.post(server_resource.url)
+    assert response.status_code == 405
+
+
+def test_file_validator_headers(
+    tmp_path: pathlib.Path, provider: Provider, http: requests.Session
+) -> None:
+    path = tmp_path / "hello.txt"
+    path.write_text("hello, world")
+
+    server_resource = provider.create(path, headers={"X-Servir": "1"})
+    assert isinstance(server_resource, FileResource)
+    assert server_resource.size == 12
+    response = http.get(server_resource.url)
+    assert response.headers["ETag"]
+    assert response.headers["Last-Modified"]
+    assert response.headers["X-Servir"] == "1"
+
+    response = http.get(server_resource.url, headers={"Range": "bytes=0-4"})
+    assert response.text == "hello"
+    assert response.headers["ETag"]
+    assert response.headers["X-Servir"] == "1"
+
+
+def test_file_not_modified(
+    tmp_path: pathlib.Path, provider: Provider, http: requests.Session
+) -> None:
+    path = tmp_path / "hello.txt"
+    path.write_text("hello, world")
+
+    server_resource = provider.create(path)
+    etag = http.get(server_resource.url).headers["ETag"]
+
+    response = http.get(server_resource.url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+
+
+def test_file_modified(
+    tmp_path: pathlib.Path, provider: Provider, http: requests.Session
+) -> None:
+    path = tmp_path / "hello.txt"
+    path.write_text("hello, world")
+    server_resource = provider.create(path)
+    assert isinstance(server_resource, FileResource)
+    etag = http.get(server_resource.url).headers["ETag"]
 
+    path.write_text("hello, longer world")
+    os.utime(path, ns=(0, 1_000_000_000))
+    assert provider.create(path) is server_resource
+    assert server_resource.size == 19
+
+    response = http.get(server_resource.url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.text == "hello, longer world"
+    assert response.headers["ETag"] != etag
+
+
+def test_file_range_request(
+    tmp_path: pathlib.Path, provider: Provider, http: requests.Session
+) -> None:
+    path = tmp_path / "hello.txt"
+    path.write_text("hello, world")
+
+    server_resource = provider.create(path)
+    response = http.get(server_resource.url, headers={"Range": "bytes=7-"})
+    assert response.status_code == 206
+    assert response.text == "world"
+    assert response.headers["Content-Range"] == "bytes 7-11/12"
+
+    response = http.get(server_resource.url, headers={"Range": "bytes=0-99"})
+    assert response.status_code == 206
+    assert response.text == "hello, world"
+    assert response.headers["Content-Length"] == "12"
+
+    response = http.head(server_resource.url, headers={"Range": "bytes=7-"})
+    assert response.status_code == 206
+    assert response.content == b""
+    assert response.headers["Content-Length"] == "5"
+
+    response = http.get(server_resource.url, headers={"Range": "bytes=0-0"})
+    assert response.status_code == 206
+    assert response.text == "h"
+    assert response.headers["Content-Range"] == "bytes 0-0/12"
+
+    # ranges in other units are ignored
+    response = http.get(server_resource.url, headers={"Range": "items=0-1"})
+    assert response.status_code == 200
+    assert response.text == "hello, world"
+
+    for header in ("bytes=12-", "bytes=5-2", "bytes=a-b"):
+        response = http.get(server_resource.url, headers={"Range": header})
+        assert response.status_code == 416
+        assert response.headers["Content-Range"] == "bytes */12"
+
+
+def test_file_content_type_json(
+    tmp_path: pathlib.Path, provider: Provider, http: requests.Session
+) -> None:
     data = {"hello": "world"}
 
     with open(tmp_path / "hello.json", "w") as f:
         json.dump(data, f)
 
     server_resource = provider.create(tmp_path / "hello.json")
-    response = requests.get(server_resource.url)
+    response = http.get(server_resource.url)
     assert response.json() == data
     assert "application/json" in response.headers["Content-Type"]
 
 
-def test_file_content_type_csv(tmp_path: pathlib.Path) -> None:
-    provider = Provider()
-
+def test_file_content_type_csv(
+    tmp_path: pathlib.Path, provider: Provider, http: requests.Session
+) -> None:
     path = tmp_path / "data.csv"
 
     with open(path, mode="w", newline="\n") as f:
         f.write("a,b,c\n1,2,3\n4,5,6")
 
     server_resource = provider.create(path)
-    response = requests.get(server_resource.url)
+    response = http.get(server_resource.url)
     assert response.text == path.read_text()
     assert "text/csv" in response.headers["Content-Type"]
 
 
-def test_content() -> None:
-    provider = Provider()
-
+def test_content(provider: Provider, http: requests.Session) -> None:
     content = "hello, world"
     str_resource = provider.create(content)
-    response = requests.get(str_resource.url)
+    response = http.get(str_resource.url)
     assert response.text == content
     assert "text/plain" in response.headers["Content-Type"]
 
 
-def test_content_explicit_extension() -> None:
-    provider = Provider()
+def test_content_repeated_requests(provider: Provider, http: requests.Session) -> None:
+    content_resource = provider.create("hello, again", headers={"X-Servir": "1"})
+    for _ in range(3):
+        response = http.get(
+            content_resource.url, headers={"Origin": "http://example.com"}
+        )
+        assert response.text == "hello, again"
+        assert response.headers["X-Servir"] == "1"
+        assert response.headers["Content-Length"] == "12"
+        assert "Access-Control-Allow-Origin" in response.headers
+
+
+def test_content_not_modified(provider: Provider, http: requests.Session) -> None:
+    for resource in (
+        provider.create("hello, etag"),
+        provider.create(io.BytesIO(b"hello, etag stream")),
+    ):
+        etag = http.get(resource.url).headers["ETag"]
+        response = http.get(resource.url, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["ETag"] == etag
+
+        response = http.get(resource.url, headers={"If-None-Match": '"other"'})
+        assert response.status_code == 200
+
+
+def test_content_explicit_extension(provider: Provider, http: requests.Session) -> None:
     data = "a,b,c,\n1,2,3,\n4,5,6"
 
     content_resource = provider.create(data, extension=".csv")
-    response = requests.get(content_resource.url)
+    response = http.get(content_resource.url)
     assert response.text == data
     assert "text/csv" in response.headers["Content-Type"]
 
 
-def test_directory_resource(tmp_path: pathlib.Path) -> None:
-    provider = Provider()
+def test_content_stream(provider: Provider, http: requests.Session) -> None:
+    data = b"\x00\x01\x02" * 1024
+
+    resource = provider.create(io.BytesIO(data))
+    assert resource.guid.endswith("-content.bin")
+    for _ in range(2):
+        response = http.get(resource.url)
+        assert response.content == data
+        assert response.headers["Content-Length"] == str(len(data))
+
+    resource = provider.create(io.BytesIO(b"a,b\n1,2"), extension=".csv")
+    response = http.get(resource.url)
+    assert response.text == "a,b\n1,2"
+    assert "text/csv" in response.headers["Content-Type"]
+
+    with pytest.raises(TypeError, match="binary mode"):
+        provider.create(io.StringIO("hello"))  # type: ignore[call-overload]
 
+
+def test_directory_resource(
+    tmp_path: pathlib.Path, provider: Provider, http: requests.Session
+) -> None:
     root = tmp_path / "data_dir"
     root.mkdir()
     (root / "hello.txt").write_text("hello, world")
@@ -86,16 +234,72 @@ def test_directory_resource(tmp_path: pathlib.Path) -> None:
     server_resource = provider.create(root)
     print(server_resource.url)
 
-    response = requests.get(server_resource.url + "/hello.txt")
+    response = http.get(server_resource.url + "/hello.txt")
     assert response.text == "hello, world"
 
-    response = requests.get(server_resource.url + "/nested_dir/foo.txt")
+    response = http.get(server_resource.url + "/nested_dir/foo.txt")
     assert response.text == "foo"
 
+    response = http.get(server_resource.url + "/missing.txt")
+    assert response.status_code == 404
+
+    response = http.get(server_resource.url + "/nested_dir")
+    assert response.status_code == 404
+
+    response = http.get(server_resource.url + "/hello.txt")
+    response = http.get(
+        server_resource.url + "/hello.txt",
+        headers={"If-None-Match": response.headers["ETag"]},
+    )
+    assert response.status_code == 304
+
+
+def test_directory_resource_containment(
+    tmp_path: pathlib.Path, provider: Provider, http: requests.Session
+) -> None:
+    root = tmp_path / "data_dir"
+    root.mkdir()
+    (tmp_path / "secret.txt").write_text("secret")
+    (root / "link.txt").symlink_to(tmp_path / "secret.txt")
+
+    server_resource = provider.create(root)
+    # percent-encoded so the client doesn't normalize the path
+    response = http.get(server_resource.url + "/%2E%2E/secret.txt")
+    assert response.status_code == 404
+
+    response = http.get(server_resource.url + "/link.txt")
+    assert response.status_code == 404
+
+    # a component replaced by a link after it was served doesn't escape either
+    (root / "sub").mkdir()
+    (root / "sub" / "f.txt").write_text("inside")
+    (tmp_path / "outside").mkdir()
+    (tmp_path / "outside" / "f.txt").write_text("outside")
+    assert http.get(server_resource.url + "/sub/f.txt").text == "inside"
+    shutil.rmtree(root / "sub")
+    (root / "sub").symlink_to(tmp_path / "outside")
+    response = http.get(server_resource.url + "/sub/f.txt")
+    assert response.status_code == 404
 
-def test_tileset_resource() -> None:
-    provider = Provider()
 
+def test_directory_resource_new_files(
+    tmp_path: pathlib.Path, provider: Provider, http: requests.Session
+) -> None:
+    root = tmp_path / "new_files"
+    root.mkdir()
+    server_resource = provider.create(root)
+
+    response = http.get(server_resource.url + "/later.txt")
+    assert response.status_code == 404
+
+    # files added after the directory is served are picked up
+    (root / "later.txt").write_text("later")
+    response = http.get(server_resource.url + "/later.txt")
+    assert response.status_code == 200
+    assert response.text == "later"
+
+
+def test_tileset_resource(provider: Provider, http: requests.Session) -> None:
     class Tileset:
         @property
         def uid(self) -> str:
@@ -112,33 +316,180 @@ def test_tileset_resource() -> None:
     assert isinstance(resource, TilesetResource)
 
     resource_url = f"{resource.server}tileset_info/?d={resource.uid}"
-    info = requests.get(resource_url).json()
+    info = http.get(resource_url).json()
     assert info[resource.uid] == "tile_info"
     tile_url = resource_url.replace("tileset_info", "tiles") + ".0.0"
-    tiles = requests.get(tile_url).json()
+    tiles = http.get(tile_url).json()
     assert f"{resource.uid}.0.0" in tiles
 
+    response = http.get(f"{resource.server}chrom-sizes/?id=missing")
+    assert response.status_code == 404
+
+
+def test_tiles_across_tilesets(provider: Provider, http: requests.Session) -> None:
+    requested: dict[str, list[str]] = {}
+
+    class Tileset:
+        def __init__(self, uid: str):
+            self._uid = uid
+
+        @property
+        def uid(self) -> str:
+            return self._uid
+
+        def tiles(self, tile_ids: typing.Sequence[str]) -> list[typing.Any]:
+            requested[self._uid] = list(tile_ids)
+            return [(tid, tid.upper()) for tid in tile_ids]
+
+        def info(self) -> typing.Any:
+            return {}
+
+    a = provider.create(Tileset("a"))
+    provider.create(Tileset("b"))
+
+    query = "d=a.0.0&d=b.1.0&d=a.1.1&d=a.0.0"
+    tiles = http.get(f"{a.server}tiles/?{query}").json()
+    assert tiles == {"a.0.0": "A.0.0", "a.1.1": "A.1.1", "b.1.0": "B.1.0"}
+    # each tileset is asked once, for its unique tile ids
+    assert requested == {"a": ["a.0.0", "a.1.1"], "b": ["b.1.0"]}
+
+    response = http.get(f"{a.server}tiles/?d=c.0.0")
+    assert response.status_code == 400
+
+
+def test_tiles_compressed(provider: Provider, http: requests.Session) -> None:
+    class Tileset:
+        uid = "gz"
+
+        def tiles(self, tile_ids: typing.Sequence[str]) -> list[typing.Any]:
+            return [(tid, list(range(1000))) for tid in tile_ids]
+
+        def info(self) -> typing.Any:
+            return {}
+
+    resource = provider.create(Tileset())
+    url = f"{resource.server}tiles/?d=gz.0.0"
+    response = http.get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.json()["gz.0.0"] == list(range(1000))
+
+    response = http.get(url, headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["Content-Length"] == str(len(response.content))
 
-def test_resource_cleanup() -> None:
+
+def test_tileset_batching(provider: Provider) -> None:
+    calls: list[int] = []
+
+    class Tileset:
+        uid = "batch"
+
+        def tiles(self, tile_ids: typing.Sequence[str]) -> list[typing.Any]:
+            calls.append(len(tile_ids))
+            return [(tid, None) for tid in tile_ids]
+
+        def info(self) -> typing.Any:
+            return {}
+
+    # a wide window, so the batching doesn't depend on how quickly requests arrive
+    resource = provider.create(Tileset(), batch_delay=0.05)
+    urls = [f"{resource.server}tiles/?d=batch.0.{i}" for i in range(32)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=32) as executor:
+        responses = list(executor.map(requests.get, urls))
+
+    assert all(response.status_code == 200 for response in responses)
+    assert sum(calls) == len(urls)
+    # concurrent requests should be served by batched calls to the tileset
+    assert max(calls) > 1
+
+
+def test_provider_url_after_restart(http: requests.Session) -> None:
+    provider = Provider().start()
+    url = provider.url
+    assert url == f"http://{provider.host}:{provider.port}"
+
+    provider.proxy = True
+    assert provider.url == f"/proxy/{provider.port}"
+    provider.proxy = False
+
+    resource = provider.create("hello, world")
+    assert resource.url is resource.url
+
+    provider.stop().start()
+    assert provider.url == f"http://{provider.host}:{provider.port}"
+    assert resource.url.startswith(provider.url)
+    assert http.get(resource.url).text == "hello, world"
+    provider.stop()
+
+
+def test_max_threads(http: requests.Session) -> None:
+    from anyio import from_thread, to_thread
+    from starlette.requests import Request
+    from starlette.responses import PlainTextResponse, Response
+
+    from servir._resources import Resource
+
+    class ThreadsResource(Resource):
+        def get(self, request: Request) -> Response:
+            # handlers run in the worker thread pool, so query the event loop
+            tokens = from_thread.run_sync(
+                lambda: to_thread.current_default_thread_limiter().total_tokens
+            )
+            return PlainTextResponse(str(tokens))
+
+    provider = Provider(max_threads=7).start()
+    resource = ThreadsResource(provider=provider)
+    provider._resources[resource.guid] = resource
+    assert http.get(resource.url).text == "7"
+    provider.stop()
+
+
+def test_resource_release(http: requests.Session) -> None:
     provider = Provider()
     assert not provider._resources
 
     content = "hello, world"
 
     resource1 = provider.create(content)
-    resource_ref = weakref.ref(resource1)
     assert len(provider._resources) == 1
 
     resource2 = provider.create(content)
-    assert resource1 == resource2
+    assert resource1 is resource2
     assert len(provider._resources) == 1
 
-    # should not trigger cleanup
+    # resources are kept alive by the provider
     del resource1
     assert len(provider._resources) == 1
-    assert resource_ref() is resource2
+    assert http.get(resource2.url).text == content
 
-    # should trigger cleanup
-    del resource2
+    provider.release(resource2)
     assert len(provider._resources) == 0
-    assert resource_ref() is None
+    assert http.get(resource2.url).status_code == 404
+
+    # releasing twice is a no-op
+    provider.release(resource2)
+
+
+def test_max_resources(http: requests.Session) -> None:
+    provider = Provider(max_resources=2)
+
+    first = provider.create("first")
+    second = provider.create("second")
+    # re-creating a resource marks it as most recently created
+    assert provider.create("first") is first
+
+    provider.create("third")
+    assert list(provider._resources) == [first.guid, provider.create("third").guid]
+    assert http.get(second.url).status_code == 404
+
+
+def test_weak_resources(http: requests.Session) -> None:
+    provider = Provider(weak=True)
+
+    resource = provider.create("hello, world")
+    url = resource.url
+    assert http.get(url).text == "hello, world"
+
+    del resource
+    gc.collect()
+    assert http.get(url).status_code == 404
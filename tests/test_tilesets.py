@@ -1,16 +1,125 @@
 from __future__ import annotations
 
+import asyncio
+import json
+import typing
+
 import pytest
+from starlette.requests import Request
+
+from servir._protocols import TilesetProtocol
+from servir._tilesets import TilesetResource, tileset_info
+
+
+class Tileset:
+    uid = "a"
 
-from servir._tilesets import get_list
+    def tiles(self, tile_ids: typing.Sequence[str]) -> list[typing.Any]:
+        return [(tid, None) for tid in tile_ids]
+
+    def info(self) -> typing.Any:
+        return {"min_pos": [0]}
 
 
 @pytest.mark.parametrize(
-    "query, key, expected",
+    "query, expected",
     [
-        ("d=id1&d=id2&d=id3", "d", ["id1", "id2", "id3"]),
-        ("d=1&e=2&d=3", "d", ["1", "3"]),
+        (b"d=a", {"a": {"min_pos": [0]}}),
+        (
+            b"d=a&e=b&d=b",
+            {"a": {"min_pos": [0]}, "b": {"error": "No such tileset with uid: b"}},
+        ),
+        (b"", {}),
     ],
 )
-def test_get_list(query: str, key: str, expected: list[str]) -> None:
-    assert get_list(query, key) == expected
+def test_tileset_info(query: bytes, expected: dict[str, typing.Any]) -> None:
+    tileset: TilesetProtocol = Tileset()
+    tilesets = {"a": TilesetResource(tileset, provider=typing.cast(typing.Any, None))}
+    request = Request({"type": "http", "query_string": query, "headers": []})
+    response = asyncio.run(tileset_info(request, tilesets=tilesets))
+    assert json.loads(bytes(response.body)) == expected
+
+
+def test_tileset_info_cache() -> None:
+    calls: list[None] = []
+
+    class CountingTileset(Tileset):
+        def info(self) -> typing.Any:
+            calls.append(None)
+            return {"calls": len(calls)}
+
+    provider = typing.cast(typing.Any, None)
+    resource = TilesetResource(CountingTileset(), provider=provider)
+    assert resource.info() == resource.info() == {"calls": 1}
+    resource.refresh()
+    assert resource.info() == {"calls": 2}
+
+    resource = TilesetResource(CountingTileset(), provider=provider, cacheable=False)
+    assert resource.info() != resource.info()
+
+
+def test_serialized_info_cache() -> None:
+    calls: list[None] = []
+
+    class CountingTileset(Tileset):
+        def info(self) -> typing.Any:
+            calls.append(None)
+            return {"calls": len(calls)}
+
+    provider = typing.cast(typing.Any, None)
+    resource = TilesetResource(CountingTileset(), provider=provider)
+    assert resource.serialized_info() is resource.serialized_info()
+    assert json.loads(b"{" + resource.serialized_info() + b"}") == {"a": {"calls": 1}}
+    resource.refresh()
+    assert resource.serialized_info() == b'"a":{"calls":2}'
+
+    resource = TilesetResource(CountingTileset(), provider=provider, cacheable=False)
+    assert resource.serialized_info() != resource.serialized_info()
+
+
+def test_serialized_tiles_cache() -> None:
+    requested: list[list[str]] = []
+
+    class RecordingTileset(Tileset):
+        def tiles(self, tile_ids: typing.Sequence[str]) -> list[typing.Any]:
+            requested.append(list(tile_ids))
+            return super().tiles(tile_ids)
+
+    provider = typing.cast(typing.Any, None)
+    # each serialized tile is 10 bytes, so two fit in the cache
+    resource = TilesetResource(RecordingTileset(), provider, max_cache_size=25)
+    assert resource.serialized_tiles(["a.0", "a.1"]) == [b'"a.0":null', b'"a.1":null']
+    assert resource.serialized_tiles(["a.1", "a.2"]) == [b'"a.1":null', b'"a.2":null']
+    # "a.0" was evicted, as the least recently requested
+    resource.serialized_tiles(["a.0"])
+    assert requested == [["a.0", "a.1"], ["a.2"], ["a.0"]]
+
+    resource.refresh()
+    resource.serialized_tiles(["a.0"])
+    assert requested[-1] == ["a.0"]
+
+
+def test_coalesced_serialized_tiles() -> None:
+    requested: list[list[str]] = []
+
+    class RecordingTileset(Tileset):
+        def tiles(self, tile_ids: typing.Sequence[str]) -> list[typing.Any]:
+            requested.append(list(tile_ids))
+            return super().tiles(tile_ids)
+
+    provider = typing.cast(typing.Any, None)
+    resource = TilesetResource(RecordingTileset(), provider=provider, cacheable=False)
+
+    async def fetch() -> list[list[bytes]]:
+        cancelled = asyncio.ensure_future(resource.coalesced_serialized_tiles(["a.2"]))
+        results = asyncio.gather(
+            resource.coalesced_serialized_tiles(["a.0", "a.1"]),
+            resource.coalesced_serialized_tiles(["a.1"]),
+        )
+        await asyncio.sleep(0)
+        # a caller going away doesn't affect the rest of its batch
+        cancelled.cancel()
+        return list(await results)
+
+    assert asyncio.run(fetch()) == [[b'"a.0":null', b'"a.1":null'], [b'"a.1":null']]
+    assert requested == [["a.2", "a.0", "a.1"]]
@@ -1,17 +1,34 @@
 from __future__ import annotations
 
+import asyncio
+import dataclasses
+import io
+import json
+import os
 import pathlib
+import threading
+import typing
 
 import pytest
 from starlette.responses import FileResponse, StreamingResponse
 
 from servir._util import (
+    SMALL_RANGE_SIZE,
     ContentRange,
+    FileRangeResponse,
+    ORJSONResponse,
+    content_hash,
     create_file_response,
+    create_path_identifier,
     create_resource_identifier,
+    dumps_json_member,
+    etag_matches,
     guess_media_type,
-    md5,
+    iter_json_object,
+    read_file_blocks,
     read_file_byte_range,
+    read_spooled_blocks,
+    spool_stream,
 )
 
 
@@ -22,11 +39,15 @@ from servir._util import (
         ("bytes=500-", ContentRange(500, None)),
         ("bytes=500-999,", ContentRange(500, 999)),
         ("bytes=1-,", ContentRange(1, None)),
+        (" Bytes=0-0 ", ContentRange(0, 0)),
     ],
 )
 def test_content_range(header: str, expected: ContentRange) -> None:
     content_range = ContentRange.parse_header(header)
     assert content_range == expected
+    assert not hasattr(content_range, "__dict__")
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        content_range.start = 1  # type: ignore[misc]
 
 
 @pytest.mark.parametrize(
@@ -34,6 +55,9 @@ def test_content_range(header: str, expected: ContentRange) -> None:
     [
         ("bytes=500-999, 501-399"),
         ("bytes=0-100, -399"),
+        ("bytes=-399"),
+        ("bytes=0+1"),
+        ("items=0-1"),
     ],
 )
 def test_unsupported_content_range(header: str) -> None:
@@ -41,8 +65,35 @@ def test_unsupported_content_range(header: str) -> None:
         ContentRange.parse_header(header)
 
 
-def test_md5() -> None:
-    assert md5(b"test") == md5("test")
+def test_create_file_response_other_range_unit(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "test.txt"
+    path.write_text("test")
+    # a range in an unknown unit is ignored, and the whole file is sent
+    response = create_file_response(path, "items=0-1")
+
+    messages: list[typing.MutableMapping[str, typing.Any]] = []
+
+    async def receive() -> typing.MutableMapping[str, typing.Any]:
+        await asyncio.sleep(1)
+        return {"type": "http.disconnect"}
+
+    async def send(message: typing.MutableMapping[str, typing.Any]) -> None:
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "headers": [(b"range", b"items=0-1")],
+        "asgi": {"spec_version": "2.4"},
+    }
+    asyncio.run(response(scope, receive, send))
+    assert messages[0]["status"] == 200
+    assert b"".join(m.get("body", b"") for m in messages[1:]) == b"test"
+
+
+def test_content_hash() -> None:
+    assert content_hash(b"test") == content_hash("test")
+    assert len(content_hash("test")) == 32
 
 
 @pytest.mark.parametrize(
@@ -61,15 +112,56 @@ def test_read_file_blocks(
     assert read_file_byte_range(test_file, start, end) == expected
 
 
+@pytest.mark.parametrize(
+    "start, end, block_size, expected",
+    [
+        (0, 4, 2, [b"te", b"st"]),
+        (1, 4, 2, [b"es", b"t"]),
+        (0, 10, 3, [b"tes", b"t"]),
+        (4, 4, 2, []),
+    ],
+)
+def test_read_file_blocks_chunked(
+    tmp_path: pathlib.Path, start: int, end: int, block_size: int, expected: list[bytes]
+) -> None:
+    test_file = tmp_path / "test.txt"
+    test_file.write_text("test")
+    assert list(read_file_blocks(test_file, start, end, block_size)) == expected
+
+
+def test_read_file_blocks_truncated(tmp_path: pathlib.Path) -> None:
+    data = bytes(range(256)) * 1024
+    test_file = tmp_path / "test.bin"
+    test_file.write_bytes(data)
+    blocks = read_file_blocks(test_file, 70_001, 200_000, 4096)
+    assert next(blocks) == data[70_001:74_097]
+    # a file truncated while it is read ends the blocks early
+    os.truncate(test_file, 80_000)
+    assert b"".join(blocks) == data[74_097:80_000]
+
+
+def test_spool_stream() -> None:
+    data = b"0123456789" * 10
+    digest, spool, size = spool_stream(io.BytesIO(data), block_size=7, max_size=16)
+    assert digest == content_hash(data)
+    assert size == len(data)
+    blocks = list(read_spooled_blocks(spool, threading.Lock(), size, block_size=30))
+    assert [len(block) for block in blocks] == [30, 30, 30, 10]
+    assert b"".join(blocks) == data
+
+
 @pytest.mark.parametrize(
     "path, expected",
     [
         ("none", "application/octet-stream"),
         ("data.txt", "text/plain"),
         ("data.json", "application/json"),
+        ("data.v2.csv", "text/csv"),
+        ("nested.dir/data", "application/octet-stream"),
+        (pathlib.Path("nested.dir/data.txt"), "text/plain"),
     ],
 )
-def test_guess_media_type(path: str, expected: str) -> None:
+def test_guess_media_type(path: str | pathlib.Path, expected: str) -> None:
     assert guess_media_type(path) == expected
 
 
@@ -92,3 +184,116 @@ def test_create_file_response(
 def test_create_resource_identifier() -> None:
     identifer = create_resource_identifier("hello, world", "data.txt")
     assert identifer.endswith("-data.txt")
+
+
+def test_create_path_identifier(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+
+    monkeypatch.chdir(tmp_path / "a")
+    identifier = create_path_identifier(pathlib.Path("data.txt"))
+    assert identifier.endswith("-data.txt")
+    assert identifier == create_path_identifier(tmp_path / "a" / "data.txt")
+
+    # relative paths are memoized by their absolute path
+    monkeypatch.chdir(tmp_path / "b")
+    assert create_path_identifier(pathlib.Path("data.txt")) != identifier
+
+    # links are identified by their own path, not their target
+    (tmp_path / "b" / "data.txt").symlink_to(tmp_path / "a" / "data.txt")
+    assert create_path_identifier(tmp_path / "b" / "data.txt") != identifier
+
+
+@pytest.mark.parametrize(
+    "if_none_match, expected",
+    [
+        ('"abc"', True),
+        ('W/"abc"', True),
+        ('"xyz", "abc"', True),
+        ("*", True),
+        ('"xyz"', False),
+    ],
+)
+def test_etag_matches(if_none_match: str, expected: bool) -> None:
+    assert etag_matches(if_none_match, '"abc"') == expected
+
+
+def test_orjson_response() -> None:
+    response = ORJSONResponse({"a": [1, 2.5, None], "b": "c"})
+    assert json.loads(bytes(response.body)) == {"a": [1, 2.5, None], "b": "c"}
+    assert response.media_type == "application/json"
+
+
+@pytest.mark.parametrize(
+    "groups, expected",
+    [
+        ([], {}),
+        ([[], []], {}),
+        (
+            [[("a", 1)], [], [("b", [1, 2]), ("c", None)]],
+            {"a": 1, "b": [1, 2], "c": None},
+        ),
+    ],
+)
+def test_iter_json_object(
+    groups: list[list[tuple[str, typing.Any]]], expected: dict[str, typing.Any]
+) -> None:
+    members = [[dumps_json_member(*pair) for pair in group] for group in groups]
+    assert json.loads(b"".join(iter_json_object(members))) == expected
+
+
+@pytest.mark.parametrize("extensions", [{}, {"http.response.zerocopysend": {}}])
+@pytest.mark.parametrize("size", [1, 1024])
+def test_file_range_response(
+    tmp_path: pathlib.Path, extensions: dict[str, object], size: int
+) -> None:
+    data = bytes(range(256)) * size
+    path = tmp_path / "data.bin"
+    path.write_bytes(data)
+    response = FileRangeResponse(path, start=7, end=len(data), status_code=206)
+
+    messages: list[typing.MutableMapping[str, typing.Any]] = []
+
+    async def receive() -> typing.MutableMapping[str, typing.Any]:
+        await asyncio.sleep(1)
+        return {"type": "http.disconnect"}
+
+    async def send(message: typing.MutableMapping[str, typing.Any]) -> None:
+        if message["type"] == "http.response.zerocopysend":
+            file = message["file"]
+            file.seek(message["offset"])
+            message = {**message, "body": file.read(message["count"])}
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "asgi": {"spec_version": "2.4"}}
+    asyncio.run(response({**scope, "extensions": extensions}, receive, send))
+    assert messages[0]["status"] == 206
+    assert b"".join(m.get("body", b"") for m in messages[1:]) == data[7:]
+
+    # small ranges are sent in one message, large ones with zero-copy if possible
+    zerocopy = any(m["type"] == "http.response.zerocopysend" for m in messages)
+    assert zerocopy == (bool(extensions) and len(data) > SMALL_RANGE_SIZE)
+
+
+def test_file_range_response_block_size(tmp_path: pathlib.Path) -> None:
+    data = bytes(range(256)) * 1024
+    path = tmp_path / "data.bin"
+    path.write_bytes(data)
+    response = FileRangeResponse(path, start=7, end=len(data), block_size=64 << 10)
+
+    bodies: list[bytes] = []
+
+    async def receive() -> typing.MutableMapping[str, typing.Any]:
+        await asyncio.sleep(1)
+        return {"type": "http.disconnect"}
+
+    async def send(message: typing.MutableMapping[str, typing.Any]) -> None:
+        if message.get("body"):
+            bodies.append(bytes(message["body"]))
+
+    scope = {"type": "http", "method": "GET", "asgi": {"spec_version": "2.4"}}
+    asyncio.run(response(scope, receive, send))
+    assert b"".join(bodies) == data[7:]
+    assert [len(body) for body in bodies] == [64 << 10] * 3 + [(64 << 10) - 7]